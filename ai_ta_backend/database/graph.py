@@ -1,104 +1,515 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import os
 import re
-
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+import redis
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_neo4j import GraphCypherQAChain, Neo4jGraph
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, START, END
-from typing_extensions import TypedDict
-from flask import current_app
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from ai_ta_backend.utils.semantic_cache import SemanticCache, normalize_query
+
+logger = logging.getLogger(__name__)
+# e.g. KG_LOG_LEVEL=DEBUG locally, WARNING in production so debug messages are dropped before any formatting.
+# The app configures no logging handlers (Python's fallback only prints WARNING and up), so a valid
+# level also gets its own stderr handler. Unset leaves this logger to the app's logging config.
+_kg_log_level = os.getenv('KG_LOG_LEVEL', '').strip().upper()
+if _kg_log_level:
+    if isinstance(logging.getLevelName(_kg_log_level), int):
+        logger.setLevel(_kg_log_level)
+        _kg_log_handler = logging.StreamHandler()
+        _kg_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(_kg_log_handler)
+        logger.propagate = False  # don't print twice if the root logger gets a handler later
+    else:
+        logger.warning("Ignoring invalid KG_LOG_LEVEL=%r", _kg_log_level)
+
+
+# System prompts are rendered from these module-level templates so the multi-KB
+# strings are built once at import instead of on every chain construction.
+#
+# Every prompt is composed as PROMPT_PREAMBLE + schema + KG-specific notes/examples.
+# The preamble is byte-identical across all chains, so OpenAI's automatic prompt
+# cache (and prefix caching on self-hosted backends) can reuse it between KGs;
+# the clinical and custom-prompt chains also share the clinical schema after it.
+
+# Rules shared by every KG chain, deduplicated from the three per-chain copies and
+# written tersely since they are sent with every Cypher-generation call.
+CYPHER_GUIDELINES = """GUIDELINES FOR GENERATING CYPHER QUERIES:
+- Use only node labels, relationship types and property names from the schema.
+- Map user terms to the closest schema labels/relationship types; use synonyms when there is no direct match.
+- Prefer the most specific node type (e.g. Disease, Drug, Protein, Gene).
+- Match names case-insensitively: toLower(n.<name property>) = "term" for exact, CONTAINS "term" for partial matches.
+- Treat general terms ("related to", "associated with", "connected to") as any plausible relationship: use -[]- or several types.
+- Prefer several MATCH clauses over long path patterns; use aggregation (count, collect) when appropriate.
+- Return the most relevant properties and LIMIT results (about 10) for readability.
+- If nothing is found, retry (up to 3 times) with alternative labels, relationship types, synonyms or broader terms."""
+
+RESPONSE_FORMAT = """RESPONSE FORMAT:
+1. Briefly explain the Cypher query and why it answers the question.
+2. Present the Cypher query.
+3. If Neo4j returns nothing, say "No results found" and try an alternative query."""
+
+# Must stay free of str.format placeholders: it is prepended to every template below.
+PROMPT_PREAMBLE = """
+You are a clinical knowledge graph expert assistant that helps healthcare professionals query a medical knowledge graph.
+
+""" + CYPHER_GUIDELINES + """
+
+""" + RESPONSE_FORMAT + """
+
+"""
+
+CLINICAL_KG_PROMPT_TEMPLATE = PROMPT_PREAMBLE + """SCHEMA INFORMATION:
+{schema_info}
+
+NOTES FOR THIS KG:
+- Node names are in the `name` property.
+
+EXAMPLES:
+
+Example 1: Protein-Cellular Component Association
+User query: "Which cellular components is the protein EGR1 associated with?"
+
+Explain: To answer this question, I'll search for the Protein node with the name 'EGR1' and find all
+Cellular_component nodes connected to it via the ASSOCIATED_WITH relationship. I'll also return the
+evidence type and source for each association.
+
+Cypher:
+MATCH (p:Protein)-[r:ASSOCIATED_WITH]->(cc:Cellular_component)
+WHERE toLower(p.name) = "egr1"
+RETURN
+    p.name AS Protein,
+    cc.name AS CellularComponent,
+    cc.id AS CellularComponentID,
+    r.evidence_type AS EvidenceType,
+    r.source AS Source
+ORDER BY cc.name
+
+Example 2: Disease Pathology Samples
+User query: "List proteins detected in pathology samples for pancreatic cancer."
+
+Explain: I'll search for Disease nodes with the name 'pancreatic cancer' and find all Protein nodes
+connected via the DETECTED_IN_PATHOLOGY_SAMPLE relationship, including expression levels and prognosis data.
+
+Cypher:
+MATCH (p:Protein)-[r:DETECTED_IN_PATHOLOGY_SAMPLE]->(d:Disease)
+WHERE toLower(d.name) = "pancreatic cancer"
+RETURN
+    p.name AS Protein,
+    d.name AS Disease,
+    r.expression_low AS ExpressionLow,
+    r.expression_medium AS ExpressionMedium,
+    r.expression_high AS ExpressionHigh,
+    r.not_detected AS NotDetected,
+    r.positive_prognosis_logrank_pvalue AS PositivePrognosisP,
+    r.negative_prognosis_logrank_pvalue AS NegativePrognosisP,
+    r.linkout AS Link
+ORDER BY p.name
+
+Example 3: Gene Variants
+User query: "List all genes that have a known missense variant."
+
+Explain: I'll search for Known_variant nodes with the effect 'missense variant' and find all Gene nodes
+connected via the VARIANT_FOUND_IN_GENE relationship, returning gene and variant information.
+
+Cypher:
+MATCH (v:Known_variant)-[:VARIANT_FOUND_IN_GENE]->(g:Gene)
+WHERE toLower(v.effect) = "missense variant"
+RETURN
+    g.name AS Gene,
+    v.pvariant_id AS Variant,
+    v.external_id AS ExternalID
+ORDER BY g.name, v.pvariant_id
+LIMIT 15"""
+
+# (user query, Cypher) pairs shown to the Cypher-generating LLM. Kept as data and
+# rendered tersely: the old "Your response: - Explain: ..." prose around each
+# example was re-sent on every call without helping Cypher generation.
+PRIME_KG_EXAMPLES = (
+    (
+        "What drugs are used to treat Alzheimer's disease?",
+        'MATCH (d:disease)<-[:indication]-(drug:drug)\n'
+        'WHERE toLower(d.node_name) CONTAINS "alzheimer"\n'
+        'RETURN DISTINCT d.node_name AS Disease, drug.node_name AS Drug\n'
+        'ORDER BY d.node_name, drug.node_name',
+    ),
+    (
+        "What biological processes are associated with the BRCA1 gene?",
+        'MATCH (g:`gene_protein`)-[:bioprocess_protein]->(bp:biological_process)\n'
+        'WHERE toLower(g.node_name) = "brca1"\n'
+        'RETURN DISTINCT g.node_name AS Gene, bp.node_name AS BiologicalProcess\n'
+        'ORDER BY bp.node_name',
+    ),
+    (
+        "What are the side effects of metformin?",
+        'MATCH (d:drug)-[:drug_effect]->(e:`effect_phenotype`)\n'
+        'WHERE toLower(d.node_name) = "metformin"\n'
+        'RETURN DISTINCT d.node_name AS Drug, e.node_name AS SideEffect\n'
+        'ORDER BY e.node_name',
+    ),
+    (
+        "Which genes are expressed in the heart?",
+        'MATCH (a:anatomy)<-[:anatomy_protein_present]-(g:`gene_protein`)\n'
+        'WHERE toLower(a.node_name) CONTAINS "heart"\n'
+        'RETURN DISTINCT a.node_name AS Anatomy, g.node_name AS Gene\n'
+        'ORDER BY a.node_name, g.node_name',
+    ),
+    (
+        "Which pathways involve the TNF gene?",
+        'MATCH (g:`gene_protein`)-[:pathway_protein]->(p:pathway)\n'
+        'WHERE toLower(g.node_name) = "tnf" OR toLower(g.node_name) = "tumor necrosis factor"\n'
+        'RETURN DISTINCT g.node_name AS Gene, p.node_name AS Pathway\n'
+        'ORDER BY p.node_name',
+    ),
+    (
+        "What proteins interact with the ACE2 receptor?",
+        'MATCH (g1:`gene_protein`)-[:protein_protein]->(g2:`gene_protein`)\n'
+        'WHERE toLower(g1.node_name) = "ace2"\n'
+        'RETURN DISTINCT g1.node_name AS Protein, g2.node_name AS InteractingProtein\n'
+        'ORDER BY g2.node_name',
+    ),
+    (
+        "What cellular components are associated with mitochondrial diseases?",
+        'MATCH (d:disease)-[:disease_protein]->(g:`gene_protein`)-[:cellcomp_protein]->(cc:cellular_component)\n'
+        'WHERE toLower(d.node_name) CONTAINS "mitochondri"\n'
+        'RETURN DISTINCT d.node_name AS Disease, g.node_name AS Gene, cc.node_name AS CellularComponent\n'
+        'ORDER BY d.node_name, cc.node_name',
+    ),
+    (
+        "What genes are associated with congenital hyperinsulinism?",
+        'MATCH (d:disease)-[:disease_protein]->(g:`gene_protein`)\n'
+        'WHERE toLower(d.node_name) CONTAINS "hyperinsulin"\n'
+        'RETURN DISTINCT d.node_name AS Disease, g.node_name AS Gene\n'
+        'ORDER BY d.node_name, g.node_name',
+    ),
+    (
+        "Which drugs interact with the TNF inhibitor adalimumab?",
+        'MATCH (d1:drug)-[r:drug_drug]->(d2:drug)\n'
+        'WHERE toLower(d1.node_name) = "adalimumab"\n'
+        'RETURN DISTINCT d1.node_name AS Drug, d2.node_name AS InteractingDrug,\n'
+        '  r.display_relation AS InteractionType\n'
+        'ORDER BY d2.node_name',
+    ),
+)
+
+_PRIME_KG_EXAMPLES_TEXT = "\n\n".join(f"Q: {question}\n{cypher}" for question, cypher in PRIME_KG_EXAMPLES)
+
+PRIME_KG_PROMPT_TEMPLATE = PROMPT_PREAMBLE + """SCHEMA INFORMATION:
+{schema_info}
+
+NOTES FOR THIS KG:
+- Node names and ids are in `node_name` / `node_id`; filter relationships on `display_relation` when relevant.
+- Key labels: `gene_protein`, disease, drug, phenotype; genes link to diseases via disease_protein.
+
+EXAMPLES (user query, then the Cypher that answers it):
+{examples}"""
+
+# Everything except the caller's additional instructions. It is rendered once per
+# schema and kept byte-identical across calls, with the dynamic instructions
+# appended after it, so OpenAI's automatic prompt caching (>=1024-token prefix)
+# can reuse the prefix between custom-prompt chains.
+CUSTOM_PROMPT_PREFIX_TEMPLATE = PROMPT_PREAMBLE + """SCHEMA INFORMATION:
+{schema_info}
+
+NOTES FOR THIS KG:
+- Node names are in the `name` property.
+- Treatments: TREATS / PRESCRIBED_FOR; side effects: CAUSES / HAS_SIDE_EFFECT; interactions: INTERACTS_WITH.
+- Present results clearly with a brief clinical interpretation and, if relevant, follow-up queries.
+
+Remember that you're helping healthcare professionals, so be precise and clinically accurate."""
+
+
+@functools.lru_cache(maxsize=32)
+def _render_system_prompt(template: str, **kwargs) -> str:
+    """Fill a system prompt template. Cached per (template, schema, instructions)."""
+    return template.format(**kwargs)
+
+
+class _PromptCacheUsageLogger(BaseCallbackHandler):
+    """Logs how many prompt tokens OpenAI served from its prompt cache."""
+
+    def on_llm_end(self, response, **kwargs):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        logger.debug("LLM prompt_tokens=%s cached_tokens=%s", token_usage.get("prompt_tokens"), cached_tokens)
+
+
+@functools.lru_cache(maxsize=1)
+def _openai_http_client() -> httpx.Client:
+    """One keep-alive connection pool to OpenAI shared by every model's client."""
+    return httpx.Client(limits=httpx.Limits(max_connections=100, max_keepalive_connections=50))
+
+
+@functools.lru_cache(maxsize=None)
+def _chat_llm(model: str, api_key: str) -> ChatOpenAI:
+    """Shared ChatOpenAI client per model, so every chain reuses one HTTP connection pool."""
+    return ChatOpenAI(temperature=0,
+                      model=model,
+                      api_key=api_key,
+                      http_client=_openai_http_client(),
+                      callbacks=[_PromptCacheUsageLogger()])
+
+
+# Cypher is generated with the cheap model first and escalated to the strong one only
+# when that attempt errors or comes back empty. Set KG_CYPHER_MODEL_CHEAP="" to always use the strong model.
+KG_CYPHER_MODEL_STRONG = os.getenv('KG_CYPHER_MODEL_STRONG', 'gpt-4o')
+KG_CYPHER_MODEL_CHEAP = os.getenv('KG_CYPHER_MODEL_CHEAP', 'gpt-4o-mini')
+# Model that summarizes the (truncated) KG rows for the user.
+KG_SUMMARY_MODEL = os.getenv('KG_SUMMARY_MODEL', 'gpt-4o-mini')
+
+
+# Server-side transaction timeout for every KG query, in seconds.
+NEO4J_QUERY_TIMEOUT = float(os.getenv('NEO4J_QUERY_TIMEOUT', '120'))
+
+
+def _neo4j_driver_config() -> dict:
+    """Bolt connection pool settings for both KG drivers, tunable per deployment."""
+    return {
+        'max_connection_pool_size': int(os.getenv('NEO4J_POOL_SIZE', '100')),
+        'connection_acquisition_timeout': float(os.getenv('NEO4J_ACQ_TIMEOUT', '60')),
+        'max_connection_lifetime': int(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', '3600')),
+        'keep_alive': True,
+    }
+
+
+def _compact_schema(structured_schema: dict) -> str:
+    """
+    Render a Neo4jGraph.structured_schema as a terse NODES/RELS listing for the system prompt,
+    typically several times fewer tokens than the narrated `graph.schema` string.
 
+    e.g. NODES: Disease(id,name); Drug(id,name)
+         REL PROPS: ASSOCIATED_WITH(source)
+         RELS: (Drug)-[TREATS]->(Disease)
+    """
 
-# Unified state for both PrimeKG and Clinical KG
-class KGQueryState(TypedDict):
-    user_query: str
-    attempt: int
-    queries_tried: list[str]
-    results: list[dict] | dict  # allow both for compatibility
-    max_attempts: int
+    def props(entries):
+        return ",".join(entry["property"] for entry in entries)
+
+    nodes = "; ".join(f"{label}({props(entries)})" for label, entries in structured_schema.get("node_props", {}).items())
+    rel_props = "; ".join(f"{rel}({props(entries)})" for rel, entries in structured_schema.get("rel_props", {}).items() if entries)
+    rels = "; ".join(f"({rel['start']})-[{rel['type']}]->({rel['end']})" for rel in structured_schema.get("relationships", []))
+    lines = [f"NODES: {nodes}"]
+    if rel_props:
+        lines.append(f"REL PROPS: {rel_props}")
+    lines.append(f"RELS: {rels}")
+    return "\n".join(lines)
 
-# Example strategies for generating Cypher queries (can be extended)
-def generate_primekg_cypher(user_query: str, attempt: int) -> str:
-    """
-    Generate different Cypher queries for each attempt, aligned with the system prompt instructions.
-    For queries mentioning two entities, retries after the first attempt will use CONTAINS for node names and match any relationship type between the nodes.
-    """
-    general_terms = ["related to", "associated with", "connected to", "linked to", "connection", "relationship"]
-    lower_query = user_query.lower()
-    uses_general_term = any(term in lower_query for term in general_terms)
-
-    # Simple heuristic: look for two quoted entities or two 'and'-separated terms
-    # e.g., "diabetes and heart disease"
-    entity_match = re.findall(r'([\w\- ]+) and ([\w\- ]+)', user_query, re.IGNORECASE)
-    if entity_match:
-        entity1, entity2 = entity_match[0]
-        entity1 = entity1.strip(' "')
-        entity2 = entity2.strip(' "')
-    else:
-        entity1 = entity2 = None
-
-    if attempt == 0:
-        # First attempt: smart mapping and synonym use for node labels/relationships
-        return f"{user_query} (map user terms to closest schema node labels/relationships, use synonyms if needed)"
-    elif (attempt == 1 or attempt == 2) and entity1 and entity2:
-        # For retries, if two entities are detected, use CONTAINS and match any relationship type
-        return (
-            f"Find any connections between entities using partial matching and any relationship type: "
-            f'MATCH (n1), (n2) '
-            f'WHERE toLower(n1.node_name) CONTAINS "{entity1.lower()}" '
-            f'AND toLower(n2.node_name) CONTAINS "{entity2.lower()}" '
-            f'MATCH (n1)-[r]-(n2) '
-            f'RETURN n1.node_name AS Entity1, n2.node_name AS Entity2, type(r) AS RelationshipType, r'
-        )
-    elif attempt == 1 and uses_general_term:
-        # Second attempt: broaden to any plausible relationship if general terms are detected
-        return f"{user_query} (broaden: treat general terms like 'related to' as any plausible relationship, use -[]-> or multiple types)"
-    elif attempt == 2:
-        # Third attempt: try alternative node labels/relationships and synonyms
-        return f"{user_query} (try alternative node labels, relationship types, and synonyms from schema)"
-    else:
-        # Fallback: most general query
-        return f"{user_query} (fallback: use the most general relationship and node label patterns)"
 
-# Example strategies for generating Cypher queries for Clinical KG (can be extended)
-def generate_clinicalkg_cypher(user_query: str, attempt: int) -> str:
+def _schema_allow_lists(env_prefix: str):
     """
-    Generate different Cypher queries for each attempt, aligned with the clinical KG system prompt instructions.
+    Node labels and relationship types to keep in a KG's prompt schema, read from comma-separated
+    {env_prefix}_SCHEMA_LABELS / {env_prefix}_SCHEMA_RELS. An empty set keeps everything.
     """
-    general_terms = ["related to", "associated with", "connected to", "linked to", "connection", "relationship"]
-    lower_query = user_query.lower()
-    uses_general_term = any(term in lower_query for term in general_terms)
 
-    # Simple heuristic: look for two quoted entities or two 'and'-separated terms
-    entity_match = re.findall(r'([\w\- ]+) and ([\w\- ]+)', user_query, re.IGNORECASE)
-    if entity_match:
-        entity1, entity2 = entity_match[0]
-        entity1 = entity1.strip(' "')
-        entity2 = entity2.strip(' "')
-    else:
-        entity1 = entity2 = None
-
-    if attempt == 0:
-        # First attempt: smart mapping and synonym use for node labels/relationships
-        return f"{user_query} (map user terms to closest schema node labels/relationships, use synonyms if needed)"
-    elif (attempt == 1 or attempt == 2) and entity1 and entity2:
-        # For retries, if two entities are detected, use CONTAINS and match any relationship type
-        return (
-            f"Find any connections between entities using partial matching and any relationship type: "
-            f'MATCH (n1), (n2) '
-            f'WHERE toLower(n1.name) CONTAINS "{entity1.lower()}" '
-            f'AND toLower(n2.name) CONTAINS "{entity2.lower()}" '
-            f'MATCH (n1)-[r]-(n2) '
-            f'RETURN n1.name AS Entity1, n2.name AS Entity2, type(r) AS RelationshipType, r'
-        )
-    elif attempt == 1 and uses_general_term:
-        # Second attempt: broaden to any plausible relationship if general terms are detected
-        return f"{user_query} (broaden: treat general terms like 'related to' as any plausible relationship, use -[]-> or multiple types)"
-    elif attempt == 2:
-        # Third attempt: try alternative node labels/relationships and synonyms
-        return f"{user_query} (try alternative node labels, relationship types, and synonyms from schema)"
+    def read(name):
+        return {item.strip() for item in os.getenv(f'{env_prefix}_{name}', '').split(',') if item.strip()}
+
+    return read('SCHEMA_LABELS'), read('SCHEMA_RELS')
+
+
+def _filter_structured_schema(structured_schema: dict, labels: set, rels: set) -> dict:
+    """Drop node labels and relationship types outside the allow-lists (empty = keep all)."""
+    if not labels and not rels:
+        return structured_schema
+
+    def keep_label(label):
+        return not labels or label in labels
+
+    def keep_rel(rel):
+        return not rels or rel in rels
+
+    return {
+        **structured_schema,
+        "node_props": {label: props for label, props in structured_schema.get("node_props", {}).items() if keep_label(label)},
+        "rel_props": {rel: props for rel, props in structured_schema.get("rel_props", {}).items() if keep_rel(rel)},
+        "relationships": [
+            rel for rel in structured_schema.get("relationships", [])
+            if keep_label(rel["start"]) and keep_label(rel["end"]) and keep_rel(rel["type"])
+        ],
+    }
+
+
+SCHEMA_PLACEHOLDER = "Schema information not available. Please refresh schema first."
+
+
+# Bump when the KG schemas are migrated; every cached copy keyed on an older version is ignored.
+KG_SCHEMA_VERSION = 1
+
+
+def _schema_cache_key(url: str, database: str) -> str:
+    """Cache key for one Neo4j database's schema, versioned by KG_SCHEMA_VERSION."""
+    digest = hashlib.sha256(f"{url}:{database}".encode()).hexdigest()[:16]
+    return f"kg_schema:{database}:v{KG_SCHEMA_VERSION}:{digest}"
+
+
+def _schema_cache_path(key: str) -> str:
+    cache_dir = os.getenv('KG_SCHEMA_CACHE_DIR', os.path.expanduser('~/.cache/ai_ta_backend/kg_schema'))
+    return os.path.join(cache_dir, key.replace(':', '_') + '.json')
+
+
+def _schema_cache_ttl() -> int:
+    return int(os.getenv('KG_SCHEMA_CACHE_TTL', str(24 * 60 * 60)))
+
+
+@functools.lru_cache(maxsize=1)
+def _shared_redis():
+    """Shared Redis tier for the schema and KG result caches, so fresh containers can reuse them too."""
+    redis_url = os.getenv('REDIS_URL')
+    # Short timeouts: an unreachable Redis should cost a cache miss, not stall the request.
+    return redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1) if redis_url else None
+
+
+def _load_cached_schema(key: str):
+    """Return the cached {schema, structured_schema} dict from disk or Redis, or None on a miss."""
+    path = _schema_cache_path(key)
+    try:
+        if time.time() - os.path.getmtime(path) < _schema_cache_ttl():
+            with open(path) as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        client = _shared_redis()
+        raw = client.get(key) if client else None
+        if raw:
+            cached = json.loads(raw)
+            # Backdate the local copy to the original save, so it expires with the Redis entry.
+            if cached.get('cached_at'):
+                _write_schema_file(path, cached, mtime=cached['cached_at'])
+            return cached
+    except (redis.RedisError, ValueError) as e:
+        logger.warning("Could not read KG schema %s from Redis: %s", key, e)
+    return None
+
+
+def _write_schema_file(path: str, cached: dict, mtime: float = None):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cached, f, default=str)
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write KG schema cache %s: %s", path, e)
+
+
+def _save_cached_schema(key: str, graph):
+    """Persist a graph's schema so the next process start can skip introspection."""
+    cached = {'schema': graph.schema, 'structured_schema': graph.structured_schema, 'cached_at': time.time()}
+    _write_schema_file(_schema_cache_path(key), cached)
+    try:
+        client = _shared_redis()
+        if client:
+            client.setex(key, _schema_cache_ttl(), json.dumps(cached, default=str))
+    except redis.RedisError as e:
+        logger.warning("Could not write KG schema %s to Redis: %s", key, e)
+
+
+def _clear_cached_schema(key: str):
+    try:
+        os.remove(_schema_cache_path(key))
+    except FileNotFoundError:
+        pass
+    try:
+        client = _shared_redis()
+        if client:
+            client.delete(key)
+    except redis.RedisError as e:
+        logger.warning("Could not delete KG schema %s from Redis: %s", key, e)
+
+
+def _kg_result_cache_key(kg_name: str, user_query: str) -> str:
+    """Exact-match key for a KG answer: same KG, schema version and normalized question."""
+    digest = hashlib.sha256(normalize_query(user_query).encode()).hexdigest()[:32]
+    return f"kg_result:{kg_name}:v{KG_SCHEMA_VERSION}:{digest}"
+
+
+def _kg_result_cache_size() -> int:
+    """KG_RESULT_CACHE_SIZE; 0 disables the exact-match KG answer cache (memory and Redis)."""
+    return int(os.getenv('KG_RESULT_CACHE_SIZE', '1024'))
+
+
+def _log_system_prompt(system_prompt: str):
+    """Log the prompt size; the full multi-KB prompt only when LOG_FULL_PROMPT=1."""
+    if os.getenv('LOG_FULL_PROMPT') == '1':
+        logger.debug("System prompt: %s", system_prompt)
     else:
-        # Fallback: most general query
-        return f"{user_query} (fallback: use the most general relationship and node label patterns)"
+        logger.debug("System prompt len=%d first80=%r", len(system_prompt), system_prompt[:80])
+
+
+# Both patterns are case-insensitive and run on the original query, so it is never copied just to lowercase it.
+_ENTITY_RE = re.compile(r'([\w\- ]+) and ([\w\- ]+)', re.IGNORECASE)
+_GENERAL_TERMS = ("related to", "associated with", "connected to", "linked to", "connection", "relationship")
+# One pass over the query instead of a substring scan per term.
+_GENERAL_TERMS_RE = re.compile("|".join(map(re.escape, _GENERAL_TERMS)), re.IGNORECASE)
+
+
+# Example strategies for generating Cypher queries (can be extended)
+def _make_cypher_gen(name_prop: str):
+    """
+    Build a retry-strategy generator for a KG whose node names live in `name_prop`.
+    The two KGs' generators differ only in that property.
+    """
+    # Built once per KG, so a retry only fills in the two entities.
+    two_entity_query = (
+        "Find any connections between entities using partial matching and any relationship type: "
+        'MATCH (n1), (n2) '
+        f'WHERE toLower(n1.{name_prop}) CONTAINS "{{e1}}" '
+        f'AND toLower(n2.{name_prop}) CONTAINS "{{e2}}" '
+        'MATCH (n1)-[r]-(n2) '
+        f'RETURN n1.{name_prop} AS Entity1, n2.{name_prop} AS Entity2, type(r) AS RelationshipType, r'
+    ).format
+
+    def generate_cypher(user_query: str, attempt: int) -> str:
+        """
+        Generate different Cypher queries for each attempt, aligned with the system prompt instructions.
+        For queries mentioning two entities, retries after the first attempt will use CONTAINS for node names and match any relationship type between the nodes.
+        """
+        if attempt == 0:
+            # First attempt: smart mapping and synonym use for node labels/relationships
+            return f"{user_query} (map user terms to closest schema node labels/relationships, use synonyms if needed)"
+
+        uses_general_term = _GENERAL_TERMS_RE.search(user_query) is not None
+
+        # Simple heuristic: look for two quoted entities or two 'and'-separated terms
+        # e.g., "diabetes and heart disease"
+        # Match on the original text and lowercase only the captured entities: lowercasing first can
+        # change which characters \w matches ("İ".lower() is "i" + a combining dot).
+        # str.lower() rather than casefold() to match Neo4j's toLower() (casefold turns "ß" into "ss").
+        m = _ENTITY_RE.search(user_query)
+        entity1, entity2 = (m.group(1).strip(' "').lower(), m.group(2).strip(' "').lower()) if m else (None, None)
+
+        if (attempt == 1 or attempt == 2) and entity1 and entity2:
+            # For retries, if two entities are detected, use CONTAINS and match any relationship type
+            return two_entity_query(e1=entity1, e2=entity2)
+        elif attempt == 1 and uses_general_term:
+            # Second attempt: broaden to any plausible relationship if general terms are detected
+            return f"{user_query} (broaden: treat general terms like 'related to' as any plausible relationship, use -[]-> or multiple types)"
+        elif attempt == 2:
+            # Third attempt: try alternative node labels/relationships and synonyms
+            return f"{user_query} (try alternative node labels, relationship types, and synonyms from schema)"
+        else:
+            # Fallback: most general query
+            return f"{user_query} (fallback: use the most general relationship and node label patterns)"
+
+    return generate_cypher
+
+
+generate_primekg_cypher = _make_cypher_gen("node_name")
+generate_clinicalkg_cypher = _make_cypher_gen("name")
 
 def run_primekg_chain(chain, cypher_query: str):
     # This function should call the chain with the cypher_query
@@ -126,370 +537,325 @@ class GraphDatabase:
     self.prime_kg_neo4j_password = os.environ['PRIME_KG_NEO4J_PASSWORD']
     self.prime_kg_neo4j_database = os.environ['PRIME_KG_NEO4J_DATABASE']
     self.vlads_openai_key = os.environ['VLADS_OPENAI_KEY']
-
-    self.clinical_kg_graph = Neo4jGraph(
+    self._graph_cache_keys = {}
+    # Exact-match cache of successful KG answers; see _get_cached_kg_result.
+    self._kg_result_cache = OrderedDict()
+    self._kg_result_cache_lock = threading.Lock()
+    # Clinical KG chains per additional-instructions string; see create_chain_with_custom_prompt.
+    self._custom_chains = OrderedDict()
+    self._custom_chains_lock = threading.Lock()
+
+    # Graphs, schemas and chains are built lazily on first access (see the
+    # cached properties below) so routes that never touch a KG don't pay for
+    # the Neo4j handshake, schema introspection and chain construction.
+    # With KG_WARM_UP_ON_INIT=1, main.py calls warm_up() in the background at
+    # app startup, so the first KG request doesn't pay for it either.
+
+  @functools.cached_property
+  def clinical_kg_graph(self):
+    return self._connect_graph(
         url=self.ckg_neo4j_uri,
         username=self.ckg_neo4j_username,
         password=self.ckg_neo4j_password,
         database=self.ckg_neo4j_database,
-        refresh_schema=True,
     )
 
-    try:
-      count = self.clinical_kg_graph.query("MATCH (n) RETURN count(n) AS node_count LIMIT 1")
-      # print(f"[DEBUG][GraphDatabase] Connected to Clinical KG Neo4j. Node count: {count[0]['node_count']}")
-    except Exception as e:
-      # print(f"[ERROR][GraphDatabase] Could not connect to Clinical KG Neo4j: {e}")
-      pass
-
-    self.prime_kg_graph = Neo4jGraph(
+  @functools.cached_property
+  def prime_kg_graph(self):
+    return self._connect_graph(
         url=self.prime_kg_neo4j_uri,
         username=self.prime_kg_neo4j_username,
         password=self.prime_kg_neo4j_password,
         database=self.prime_kg_neo4j_database,
-        refresh_schema=True,
     )
 
-    try:
-      count = self.prime_kg_graph.query("MATCH (n) RETURN count(n) AS node_count LIMIT 1")
-      # print(f"[DEBUG][GraphDatabase] Connected to Prime KG Neo4j. Node count: {count[0]['node_count']}")
-    except Exception as e:
-      # print(f"[ERROR][GraphDatabase] Could not connect to Prime KG Neo4j: {e}")
-      pass
-
+  @functools.cached_property
+  def ckg_schema_info(self):
     # Get schema information for the system prompt
-    self.ckg_schema_info = self._get_schema_info(self.clinical_kg_graph)
-    # print(f"[DEBUG][GraphDatabase] Clinical KG schema info loaded. Type: {type(self.ckg_schema_info)}, Length: {len(str(self.ckg_schema_info))}")
-    self.prime_kg_schema_info = self._get_schema_info(self.prime_kg_graph)
-    # print(f"[DEBUG][GraphDatabase] Prime KG schema info loaded. Type: {type(self.prime_kg_schema_info)}, Length: {len(str(self.prime_kg_schema_info))}")
+    return self._get_schema_info(self.clinical_kg_graph, 'CKG')
 
+  @functools.cached_property
+  def prime_kg_schema_info(self):
+    return self._get_schema_info(self.prime_kg_graph, 'PRIME_KG')
+
+  # Chain builds raise on failure (e.g. Neo4j unreachable) instead of returning None:
+  # cached_property only stores a returned value, so the next access retries the build.
+  @functools.cached_property
+  def ckg_chain(self):
     # Create the chain with the clinical KG system prompt
+    return self._create_clinical_kg_chain()
+
+  @functools.cached_property
+  def prime_kg_chain(self):
+    return self._create_prime_kg_chain()
+
+  @functools.cached_property
+  def ckg_chain_cheap(self):
+    """Clinical KG chain on KG_CYPHER_MODEL_CHEAP, tried before ckg_chain; None when disabled."""
+    if not KG_CYPHER_MODEL_CHEAP:
+      return None
+    return self._create_clinical_kg_chain(model=KG_CYPHER_MODEL_CHEAP)
+
+  @functools.cached_property
+  def prime_kg_chain_cheap(self):
+    """Prime KG chain on KG_CYPHER_MODEL_CHEAP, tried before prime_kg_chain; None when disabled."""
+    if not KG_CYPHER_MODEL_CHEAP:
+      return None
+    return self._create_prime_kg_chain(model=KG_CYPHER_MODEL_CHEAP)
+
+  def _cheap_chain(self, attr):
+    """Return the cheap chain `attr`, or None if it can't be built right now (retried on the next query)."""
     try:
-      self.ckg_chain = self._create_clinical_kg_chain()
-      # print("[DEBUG][GraphDatabase] Clinical KG chain created successfully.")
-    except Exception as e:
-      # print(f"[ERROR][GraphDatabase] Failed to create Clinical KG chain: {e}")
-      import traceback
-      traceback.print_exc()
-      self.ckg_chain = None
-    try:
-      self.prime_kg_chain = self._create_prime_kg_chain()
-      # print("[DEBUG][GraphDatabase] Prime KG chain created successfully.")
+      return getattr(self, attr)
     except Exception as e:
-      # print(f"[ERROR][GraphDatabase] Failed to create Prime KG chain: {e}")
-      import traceback
-      traceback.print_exc()
-      self.prime_kg_chain = None
+      logger.warning("Failed to create %s: %s", attr, e)
+      return None
+
+  def warm_up(self):
+    """
+    Build both KG graphs, schemas and chains concurrently, so startup costs
+    max() of the two Neo4j handshakes + chain builds instead of their sum.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+      futures = [executor.submit(getattr, self, 'ckg_chain'), executor.submit(getattr, self, 'prime_kg_chain')]
+      for future in futures:
+        try:
+          future.result()
+        except Exception:
+          # Not cached, so the first query retries the build.
+          logger.exception("KG warm-up failed")
+
+  def _connect_graph(self, url, username, password, database):
+    """Open a Neo4jGraph connection, loading its schema from the disk cache when available."""
+    graph = Neo4jGraph(
+        url=url,
+        username=username,
+        password=password,
+        database=database,
+        refresh_schema=False,
+        timeout=NEO4J_QUERY_TIMEOUT,
+        driver_config=_neo4j_driver_config(),
+    )
+    cache_key = _schema_cache_key(url, database)
+    self._graph_cache_keys[id(graph)] = cache_key
+
+    cached = _load_cached_schema(cache_key)
+    if cached and cached.get('schema'):
+      graph.schema = cached['schema']
+      graph.structured_schema = cached.get('structured_schema', {})
+    else:
+      graph.refresh_schema()
+      _save_cached_schema(cache_key, graph)
+
+    # No extra liveness probe: Neo4jGraph already calls verify_connectivity() on construction.
+    return graph
 
   def refresh_schema(self, graph):
     """Refresh the schema and update the chain with the new schema information."""
     graph.refresh_schema()
+    cache_key = self._graph_cache_keys.get(id(graph))
+    if cache_key:
+      _save_cached_schema(cache_key, graph)
+
+    # Drop the schema string and chains built from the old schema, then rebuild the main chain.
+    if graph is self.__dict__.get('clinical_kg_graph'):
+      stale, chain_attr = ('ckg_schema_info', 'ckg_chain', 'ckg_chain_cheap'), 'ckg_chain'
+      with self._custom_chains_lock:
+        self._custom_chains.clear()
+      self._clear_kg_result_cache("ClinicalKG")
+    elif graph is self.__dict__.get('prime_kg_graph'):
+      stale, chain_attr = ('prime_kg_schema_info', 'prime_kg_chain', 'prime_kg_chain_cheap'), 'prime_kg_chain'
+      self._clear_kg_result_cache("PrimeKG")
+    else:
+      return "Schema refreshed successfully"
+    self._clear_semantic_cache()
+    for attr in stale:
+      self.__dict__.pop(attr, None)
+    getattr(self, chain_attr)
 
     return "Schema refreshed successfully"
 
-  def _get_schema_info(self, graph):
-    """Extract schema information from the Neo4j database."""
-    try:
-      # This will get the schema without refreshing it (faster)
-      return graph.schema
-    except:
-      # If schema isn't available yet, return a placeholder
-      return "Schema information not available. Please refresh schema first."
+  def clear_schema_cache(self):
+    """Drop the cached KG schemas (disk and Redis) so the next process start re-introspects Neo4j."""
+    _clear_cached_schema(_schema_cache_key(self.ckg_neo4j_uri, self.ckg_neo4j_database))
+    _clear_cached_schema(_schema_cache_key(self.prime_kg_neo4j_uri, self.prime_kg_neo4j_database))
+    self._clear_kg_result_cache()
+    self._clear_semantic_cache()
+
+    return "Schema cache cleared successfully"
+
+  def batch_query(self, graph, cypher: str, params_list: list) -> list:
+    """
+    Run one Cypher statement for many parameter sets in a single round trip via UNWIND,
+    instead of issuing one query per lookup.
+
+    Args:
+        graph: The Neo4jGraph to query (e.g. self.prime_kg_graph).
+        cypher (str): Statement body that refers to the current parameter set as `row`,
+            e.g. "MATCH (n {node_id: row.id}) RETURN row.id AS id, n.node_name AS name".
+        params_list (list[dict]): One dict per lookup.
+
+    Returns:
+        list[dict]: The combined result rows.
+    """
+    if not params_list:
+      return []
+    return graph.query(f"UNWIND $rows AS row {cypher}", {"rows": params_list})
+
+  @functools.cached_property
+  def _query_executor(self):
+    # Keep this below NEO4J_POOL_SIZE so workers never wait on a bolt connection.
+    return ThreadPoolExecutor(max_workers=8)
+
+  def run_many(self, graph, cyphers: list, timeout: float = NEO4J_QUERY_TIMEOUT) -> list:
+    """
+    Execute several independent Cypher queries concurrently on an 8-thread pool.
+
+    Args:
+        graph: The Neo4jGraph to query.
+        cyphers (list[str]): Queries to run.
+        timeout (float): Seconds to wait for all queries; queries also carry NEO4J_QUERY_TIMEOUT server-side.
+
+    Returns:
+        list[list[dict]]: Rows per query, in input order. Failed or timed-out queries yield [].
+    """
+    futures = [self._query_executor.submit(graph.query, cypher) for cypher in cyphers]
+    deadline = time.monotonic() + timeout
+    results = []
+    for cypher, future in zip(cyphers, futures, strict=True):
+      try:
+        results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+      except Exception as e:
+        future.cancel()
+        logger.warning("Cypher query failed or timed out: %s (%s)", cypher, e)
+        results.append([])
+    return results
+
+  async def aquery(self, graph_name: str, questions: list, max_concurrency: int = 16) -> list:
+    """
+    Answer several questions against one KG concurrently, e.g. the parts of a compound question.
 
-  def _create_chain(self, schema_info, system_prompt, graph, return_direct=True, return_intermediate_steps=False, verbose=True):
+    Args:
+        graph_name (str): "ClinicalKG" or "PrimeKG".
+        questions (list[str]): Natural language questions.
+        max_concurrency (int): Maximum chain invocations in flight at once.
+
+    Returns:
+        list[dict]: The chain output per question, in input order. Failed questions yield {}.
+    """
+    chain_attr = {"ClinicalKG": "ckg_chain", "PrimeKG": "prime_kg_chain"}[graph_name]
+    # The first access builds the chain (Neo4j handshake + schema), so keep it off the event loop.
+    chain = await asyncio.to_thread(getattr, self, chain_attr)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def ask(question):
+      async with semaphore:
+        try:
+          return await chain.ainvoke({"query": question})
+        except Exception as e:
+          logger.warning("%s query failed: %s (%s)", graph_name, question, e)
+          return {}
+
+    return await asyncio.gather(*(ask(question) for question in questions))
+
+  def _get_schema_info(self, graph, env_prefix=None):
+    """
+    Extract schema information from the Neo4j database, without refreshing it.
+    Pruned to the env_prefix allow-lists (see _schema_allow_lists) and compacted via
+    _compact_schema unless KG_COMPACT_SCHEMA=0 and no allow-list is set.
+    """
+    schema = getattr(graph, "schema", None)
+    if not schema:
+      return SCHEMA_PLACEHOLDER
+    structured_schema = getattr(graph, "structured_schema", None)
+    if structured_schema:
+      labels, rels = _schema_allow_lists(env_prefix) if env_prefix else (set(), set())
+      if labels or rels or os.getenv('KG_COMPACT_SCHEMA', '1') != '0':
+        return _compact_schema(_filter_structured_schema(structured_schema, labels, rels))
+    return schema
+
+  def _schema_include_types(self, graph, env_prefix):
+    """
+    GraphCypherQAChain include_types matching the env_prefix allow-lists, so the schema the
+    chain adds to its own Cypher prompt is pruned the same way. [] (no filtering) when unset.
+    """
+    labels, rels = _schema_allow_lists(env_prefix)
+    structured_schema = getattr(graph, "structured_schema", None)
+    if not (labels or rels) or not structured_schema:
+      return []
+    filtered = _filter_structured_schema(structured_schema, labels, rels)
+    return sorted(set(filtered["node_props"]) | set(filtered["rel_props"]) |
+                  {rel["type"] for rel in filtered["relationships"]})
+
+  def _create_chain(self, schema_info, system_prompt, graph, return_direct=True, return_intermediate_steps=False, verbose=True,
+                    model=KG_CYPHER_MODEL_STRONG, include_types=None):
     """
     Generic chain creation helper for GraphCypherQAChain.
     """
     return GraphCypherQAChain.from_llm(
-        ChatOpenAI(temperature=0, model="gpt-4o", api_key=self.vlads_openai_key),
+        _chat_llm(model, self.vlads_openai_key),
         graph=graph,
         return_direct=return_direct,
         return_intermediate_steps=return_intermediate_steps,
         verbose=verbose,
         allow_dangerous_requests=True,
         system_message=system_prompt,
+        include_types=include_types or [],
     )
 
-  def _create_clinical_kg_chain(self):
+  def _create_clinical_kg_chain(self, model=KG_CYPHER_MODEL_STRONG):
     """Create a GraphCypherQAChain with a clinical KG system prompt."""
     schema_info = self.ckg_schema_info
-    system_prompt = f"""
-      You are a clinical knowledge graph expert assistant that helps healthcare professionals query a medical knowledge graph.
-      
-      SCHEMA INFORMATION:
-      {schema_info}
-      
-      GUIDELINES FOR GENERATING CYPHER QUERIES:
-      1. Always use the correct node labels and relationship types from the schema information.
-      2. Identify key entities from the user query and use the most specific node type available.
-      3. Use appropriate WHERE clauses with case-insensitive matching:
-        - For exact matches: WHERE toLower(n.name) = toLower("term")
-        - For partial matches: WHERE toLower(n.name) CONTAINS toLower("term")
-      4. For complex queries, use multiple MATCH clauses rather than long path patterns.
-      5. Include LIMIT clauses (typically 5-15 results) for readability.
-      6. Use correct property names from the schema.
-      7. Use aggregation functions (count, collect, etc.) when appropriate.
-      8. For path finding, consider using shortest path algorithms.
-      9. Return the most clinically relevant properties in the RETURN clause.
-      10. Try different combinations of node labels and relationship types to find the most relevant ones.
-      
-      RESPONSE FORMAT:
-      1. First, explain the Cypher query you're generating and why it addresses the user's question.
-      2. Present the Cypher query.
-      3. If the response is empty, return "No results found" and try alternative queries.
-      4. If results are found, present them as a list of dictionaries with relevant properties.
-      
-      EXAMPLES:
-
-      Example 1: Protein-Cellular Component Association
-      User query: "Which cellular components is the protein EGR1 associated with?"
-
-      Explain: To answer this question, I'll search for the Protein node with the name 'EGR1' and find all 
-      Cellular_component nodes connected to it via the ASSOCIATED_WITH relationship. I'll also return the 
-      evidence type and source for each association.
-
-      Cypher:
-      MATCH (p:Protein)-[r:ASSOCIATED_WITH]->(cc:Cellular_component)
-      WHERE toLower(p.name) = "egr1"
-      RETURN 
-          p.name AS Protein, 
-          cc.name AS CellularComponent, 
-          cc.id AS CellularComponentID, 
-          r.evidence_type AS EvidenceType, 
-          r.source AS Source
-      ORDER BY cc.name
-
-      Example 2: Disease Pathology Samples
-      User query: "List proteins detected in pathology samples for pancreatic cancer."
-
-      Explain: I'll search for Disease nodes with the name 'pancreatic cancer' and find all Protein nodes 
-      connected via the DETECTED_IN_PATHOLOGY_SAMPLE relationship, including expression levels and prognosis data.
-
-      Cypher:
-      MATCH (p:Protein)-[r:DETECTED_IN_PATHOLOGY_SAMPLE]->(d:Disease)
-      WHERE toLower(d.name) = "pancreatic cancer"
-      RETURN 
-          p.name AS Protein, 
-          d.name AS Disease, 
-          r.expression_low AS ExpressionLow, 
-          r.expression_medium AS ExpressionMedium, 
-          r.expression_high AS ExpressionHigh, 
-          r.not_detected AS NotDetected, 
-          r.positive_prognosis_logrank_pvalue AS PositivePrognosisP, 
-          r.negative_prognosis_logrank_pvalue AS NegativePrognosisP, 
-          r.linkout AS Link
-      ORDER BY p.name
-
-      Example 3: Gene Variants
-      User query: "List all genes that have a known missense variant."
-
-      Explain: I'll search for Known_variant nodes with the effect 'missense variant' and find all Gene nodes 
-      connected via the VARIANT_FOUND_IN_GENE relationship, returning gene and variant information.
-
-      Cypher:
-      MATCH (v:Known_variant)-[:VARIANT_FOUND_IN_GENE]->(g:Gene)
-      WHERE toLower(v.effect) = "missense variant"
-      RETURN 
-          g.name AS Gene, 
-          v.pvariant_id AS Variant, 
-          v.external_id AS ExternalID
-      ORDER BY g.name, v.pvariant_id
-      LIMIT 15
-
-      Note: For each query, if no results are found, try alternative approaches such as:
-      - Using different relationship types
-      - Broadening search terms
-      - Checking for synonyms
-      - Using different node properties
-      Always explain the alternative approaches being tried.
-      """
-    if current_app and current_app.debug:
-        print("SYSTEM PROMPT: ", system_prompt)
-    return self._create_chain(schema_info, system_prompt, self.clinical_kg_graph)
-
-  def _create_prime_kg_chain(self):
+    system_prompt = _render_system_prompt(CLINICAL_KG_PROMPT_TEMPLATE, schema_info=schema_info)
+    _log_system_prompt(system_prompt)
+    return self._create_chain(schema_info,
+                              system_prompt,
+                              self.clinical_kg_graph,
+                              model=model,
+                              include_types=self._schema_include_types(self.clinical_kg_graph, 'CKG'))
+
+  def _create_prime_kg_chain(self, model=KG_CYPHER_MODEL_STRONG):
     """Create a GraphCypherQAChain with a prime KG system prompt."""
     schema_info = self.prime_kg_schema_info
-    system_prompt = f"""
-    You are a clinical knowledge graph expert assistant that helps healthcare professionals query a medical knowledge graph.
-    
-    SCHEMA INFORMATION:
-    {schema_info}
-    
-    GUIDELINES FOR GENERATING CYPHER QUERIES:
-    1. Always use the correct node labels (e.g., `gene_protein`, Disease, Drug) and relationship types (e.g., "protein_protein", "disease_gene") as per the schema.
-    2. Use node properties node_name and node_id for matching entities. Prefer case-insensitive matching for node_name (e.g., toLower(n.node_name) CONTAINS toLower("...")) for partial matches.
-    3. For relationships, use the type (e.g., disease_gene for disease-gene associations) and, if relevant, filter on display_relation.
-    4. For clinical/biomedical queries, prefer specific node types (e.g., Disease, Drug, gene_protein, Phenotype).
-    5. When a user query mentions a disease (e.g., "cancer"), match Disease nodes where node_name contains the disease term (case-insensitive).
-    6. To find related genes, look for relationships between Disease nodes and gene_protein nodes (e.g., disease_gene).
-    7. Limit results to a reasonable number (e.g., LIMIT 10) for readability.
-    8. For complex queries, use multiple MATCH clauses rather than long path patterns.
-    9. Always return the most relevant properties (e.g., node_name, node_id, display_relation) in the RETURN clause.
-    10. For ambiguous queries, try multiple plausible node labels or relationship types, and explain your reasoning.
-    11. If no results are found, try up to 3 alternative queries with different node labels or relationship types.
-
-    ADDITIONAL INSTRUCTIONS:
-    - When translating user queries, always try to map user-provided terms (for node labels and relationship types) to the closest matching schema terms. If a direct match is not found, use a synonym or the most relevant node label or relationship type from the schema.
-    - If the user uses general terms like "related to", "associated with", or "connected to", interpret these as any plausible relationship type, not just a specific relationship. Use a broad relationship pattern (e.g., -[]->) or try multiple plausible relationship types.
-    - Be proactive in using synonyms and schema knowledge to maximize the chance of retrieving relevant results, even on the first attempt.
-
-    RESPONSE FORMAT:
-    1. First, explain the Cypher query you are generating and why it addresses the user's question.
-    2. Present the Cypher query.
-    3. If the response from Neo4j is empty, return "No results found" and try a new query (up to 3 attempts).
-    4. If results are found, present them as a list of dictionaries with relevant properties and provide a brief interpretation.
-
-    EXAMPLE 1:
-    User query: "What drugs are used to treat Alzheimer's disease?"
-
-    Your response:
-    - Explain: "To answer this question, I'll search for Disease nodes with 'Alzheimer' in their name and find Drug nodes connected to them via an indication relationship, which shows approved uses for drugs."
-    - Cypher:
-      MATCH (d:disease)<-[:indication]-(drug:drug)
-      WHERE toLower(d.node_name) CONTAINS "alzheimer"
-      RETURN DISTINCT d.node_name AS Disease, drug.node_name AS Drug
-      ORDER BY d.node_name, drug.node_name
-
-    EXAMPLE 2:
-    User query: "What biological processes are associated with the BRCA1 gene?"
-
-    Your response:
-    - Explain: "I'll find the gene_protein node for BRCA1 and identify all biological processes connected to it through the bioprocess_protein relationship."
-    - Cypher:
-      MATCH (g:`gene_protein`)-[:bioprocess_protein]->(bp:biological_process)
-      WHERE toLower(g.node_name) = "brca1"
-      RETURN DISTINCT g.node_name AS Gene, bp.node_name AS BiologicalProcess
-      ORDER BY bp.node_name
-
-    EXAMPLE 3:
-    User query: "What are the side effects of metformin?"
-
-    Your response:
-    - Explain: "To find side effects of metformin, I'll search for the drug node representing metformin and identify all effect_phenotype nodes connected to it via a drug_effect relationship."
-    - Cypher:
-      MATCH (d:drug)-[:drug_effect]->(e:`effect_phenotype`)
-      WHERE toLower(d.node_name) = "metformin"
-      RETURN DISTINCT d.node_name AS Drug, e.node_name AS SideEffect
-      ORDER BY e.node_name
-
-    EXAMPLE 4:
-    User query: "Which genes are expressed in the heart?"
-
-    Your response:
-    - Explain: "I'll search for anatomy nodes related to 'heart' and find gene_protein nodes that are connected to these anatomy nodes via an anatomy_protein_present relationship, indicating genes expressed in this tissue."
-    - Cypher:
-      MATCH (a:anatomy)<-[:anatomy_protein_present]-(g:`gene_protein`)
-      WHERE toLower(a.node_name) CONTAINS "heart"
-      RETURN DISTINCT a.node_name AS Anatomy, g.node_name AS Gene
-      ORDER BY a.node_name, g.node_name
-      
-    EXAMPLE 5:
-    User query: "Which pathways involve the TNF gene?"
-
-    Your response:
-    - Explain: "I'll find the gene_protein node for TNF and identify all pathway nodes connected to it through the pathway_protein relationship."
-    - Cypher:
-      MATCH (g:`gene_protein`)-[:pathway_protein]->(p:pathway)
-      WHERE toLower(g.node_name) = "tnf" OR toLower(g.node_name) = "tumor necrosis factor"
-      RETURN DISTINCT g.node_name AS Gene, p.node_name AS Pathway
-      ORDER BY p.node_name
-
-    If no results, try alternative node labels or relationship types, and explain your reasoning.
-  
-    EXAMPLE 6:
-    User query: "What proteins interact with the ACE2 receptor?"
-
-    Your response:
-    - Explain: "To find proteins that interact with ACE2, I'll search for the gene_protein node representing ACE2 and identify all other gene_protein nodes connected to it via a protein_protein relationship."
-    - Cypher:
-      MATCH (g1:`gene_protein`)-[:protein_protein]->(g2:`gene_protein`)
-      WHERE toLower(g1.node_name) = "ace2"
-      RETURN DISTINCT g1.node_name AS Protein, g2.node_name AS InteractingProtein
-      ORDER BY g2.node_name
-      
-    EXAMPLE 7:
-    User query: "What cellular components are associated with mitochondrial diseases?"
-
-    Your response:
-    - Explain: "I'll identify disease nodes related to mitochondria, find associated genes, and then discover the cellular components linked to those genes."
-    - Cypher:
-      MATCH (d:disease)-[:disease_protein]->(g:`gene_protein`)-[:cellcomp_protein]->(cc:cellular_component)
-      WHERE toLower(d.node_name) CONTAINS "mitochondri"
-      RETURN DISTINCT d.node_name AS Disease, g.node_name AS Gene, cc.node_name AS CellularComponent
-      ORDER BY d.node_name, cc.node_name
-    
-    EXAMPLE 8:
-    User query: "What genes are associated with congenital hyperinsulinism?"
-
-    Your response:
-    - Explain: "To answer this question, I'll search for Disease nodes related to hyperinsulinism and identify the gene_protein nodes connected to them through disease_protein relationships, which indicate genes associated with this condition."
-    - Cypher:
-      MATCH (d:disease)-[:disease_protein]->(g:`gene_protein`)
-      WHERE toLower(d.node_name) CONTAINS "hyperinsulin"
-      RETURN DISTINCT d.node_name AS Disease, g.node_name AS Gene
-      ORDER BY d.node_name, g.node_name
-
-    EXAMPLE 9:
-    User query: "Which drugs interact with the TNF inhibitor adalimumab?"
-
-    Your response:
-    - Explain: "To find drugs that interact with adalimumab (a TNF inhibitor), I'll search for the drug node representing adalimumab and identify other drug nodes connected to it through drug_drug relationships, which indicate potential drug interactions."
-    - Cypher:
-      MATCH (d1:drug)-[r:drug_drug]->(d2:drug)
-      WHERE toLower(d1.node_name) = "adalimumab"
-      RETURN DISTINCT d1.node_name AS Drug, d2.node_name AS InteractingDrug, 
-            r.display_relation AS InteractionType
-      ORDER BY d2.node_name
-    
-    If no results, try alternative terms related to the query and explain your reasoning.
-    """
-    if current_app and current_app.debug:
-        print("SYSTEM PROMPT: ", system_prompt)
-    return self._create_chain(schema_info, system_prompt, self.prime_kg_graph, return_direct=True, return_intermediate_steps=True, verbose=True)
+    system_prompt = _render_system_prompt(PRIME_KG_PROMPT_TEMPLATE,
+                                          schema_info=schema_info,
+                                          examples=_PRIME_KG_EXAMPLES_TEXT)
+    _log_system_prompt(system_prompt)
+    return self._create_chain(schema_info, system_prompt, self.prime_kg_graph, return_direct=True, return_intermediate_steps=True, verbose=True,
+                              model=model,
+                              include_types=self._schema_include_types(self.prime_kg_graph, 'PRIME_KG'))
 
   def create_chain_with_custom_prompt(self, additional_instructions=""):
     """
         Create a new chain with a custom prompt that includes additional instructions.
+        Chains are memoized per instruction string (the 64 most recent), so repeated calls return the same chain.
         
         Args:
             additional_instructions (str): Additional instructions to add to the system prompt
             
         Returns:
-            GraphCypherQAChain: A new chain with the custom prompt
+            GraphCypherQAChain: A chain with the custom prompt
         """
-    system_prompt = f"""
-        You are a clinical knowledge graph expert assistant that helps healthcare professionals query a medical knowledge graph.
-        
-        SCHEMA INFORMATION:
-        {self.ckg_schema_info}
-        
-        GUIDELINES FOR GENERATING CYPHER QUERIES:
-        1. Always use the correct node labels and relationship types from the schema above
-        2. For clinical entities, prefer to use specific node types like Disease, Drug, Symptom, etc.
-        3. When searching for treatments, use relationships like TREATS, PRESCRIBED_FOR, etc.
-        4. For finding side effects, use relationships like CAUSES, HAS_SIDE_EFFECT, etc.
-        5. When querying for interactions, look for INTERACTS_WITH relationships
-        6. Limit results to a reasonable number (e.g., LIMIT 10) for readability
-        7. Include relevant properties in the RETURN clause
-        8. Use appropriate WHERE clauses to filter results
-        9. For text matching, use case-insensitive matching with toLower() or CONTAINS
-        10. For complex queries, consider using multiple MATCH clauses
-        
-        RESPONSE FORMAT:
-        1. First, explain the Cypher query you're generating and why
-        2. Present the results in a clear, structured format
-        3. Provide a clinical interpretation of the results
-        4. If relevant, suggest follow-up queries the user might be interested in
-        
-        Remember that you're helping healthcare professionals, so be precise and clinically accurate.
-        
-        ADDITIONAL INSTRUCTIONS:
-        {additional_instructions}
-        """
-    if current_app and current_app.debug:
-        print("SYSTEM PROMPT: ", system_prompt)
-    return self._create_chain(self.ckg_schema_info, system_prompt, self.clinical_kg_graph, verbose=False)
+    with self._custom_chains_lock:
+      if additional_instructions in self._custom_chains:
+        self._custom_chains.move_to_end(additional_instructions)
+        return self._custom_chains[additional_instructions]
+    chain = self._build_custom_chain(additional_instructions)
+    with self._custom_chains_lock:
+      self._custom_chains[additional_instructions] = chain
+      while len(self._custom_chains) > 64:
+        self._custom_chains.popitem(last=False)
+    return chain
+
+  def _build_custom_chain(self, additional_instructions: str):
+    system_prompt = (_render_system_prompt(CUSTOM_PROMPT_PREFIX_TEMPLATE, schema_info=self.ckg_schema_info) +
+                     "\n\nADDITIONAL INSTRUCTIONS:\n" + additional_instructions)
+    _log_system_prompt(system_prompt)
+    return self._create_chain(self.ckg_schema_info,
+                              system_prompt,
+                              self.clinical_kg_graph,
+                              verbose=False,
+                              include_types=self._schema_include_types(self.clinical_kg_graph, 'CKG'))
 
   def _extract_kg_result(self, response):
     """
@@ -499,31 +865,103 @@ class GraphDatabase:
         return response.get("kg_result")
     return None
 
-  def run_kg_query_with_retries(self, user_query: str, chain, cypher_generator, max_attempts: int = 3, readable_filename: str = None):
+  def _get_cached_kg_result(self, cache_key: str):
+    """Return a previously successful KG answer from memory or Redis, or None."""
+    if _kg_result_cache_size() <= 0:
+      return None
+    with self._kg_result_cache_lock:
+      if cache_key in self._kg_result_cache:
+        self._kg_result_cache.move_to_end(cache_key)
+        return self._kg_result_cache[cache_key]
+    try:
+      client = _shared_redis()
+      raw = client.get(cache_key) if client else None
+    except redis.RedisError as e:
+      logger.warning("Could not read KG result %s from Redis: %s", cache_key, e)
+      return None
+    if not raw:
+      return None
+    try:
+      result = json.loads(raw)
+    except ValueError as e:
+      logger.warning("Ignoring unreadable KG result %s in Redis: %s", cache_key, e)
+      return None
+    self._cache_kg_result(cache_key, result, write_through=False)
+    return result
+
+  def _cache_kg_result(self, cache_key: str, result: dict, write_through: bool = True):
+    """Store a successful KG answer (LRU of KG_RESULT_CACHE_SIZE entries, Redis for KG_RESULT_CACHE_TTL seconds)."""
+    max_entries = _kg_result_cache_size()
+    if max_entries <= 0:
+      return
+    with self._kg_result_cache_lock:
+      self._kg_result_cache[cache_key] = result
+      self._kg_result_cache.move_to_end(cache_key)
+      while len(self._kg_result_cache) > max_entries:
+        self._kg_result_cache.popitem(last=False)
+    if not write_through:
+      return
+    try:
+      client = _shared_redis()
+      if client:
+        client.setex(cache_key, int(os.getenv('KG_RESULT_CACHE_TTL', str(24 * 60 * 60))), json.dumps(result, default=str))
+    except redis.RedisError as e:
+      logger.warning("Could not write KG result %s to Redis: %s", cache_key, e)
+
+  def _clear_kg_result_cache(self, kg_name: str = None):
+    """Drop cached KG answers (memory and Redis) for one KG, or for all KGs when kg_name is None."""
+    prefix = f"kg_result:{kg_name}:" if kg_name else "kg_result:"
+    with self._kg_result_cache_lock:
+      for key in [key for key in self._kg_result_cache if key.startswith(prefix)]:
+        del self._kg_result_cache[key]
+    try:
+      client = _shared_redis()
+      if client:
+        keys = list(client.scan_iter(match=prefix + "*"))
+        if keys:
+          client.delete(*keys)
+    except redis.RedisError as e:
+      logger.warning("Could not delete KG results %s* from Redis: %s", prefix, e)
+
+  def run_kg_query_with_retries(self, user_query: str, chain, cypher_generator, max_attempts: int = 3, readable_filename: str = None,
+                                cheap_chain=None):
     """
-    Generic retry logic for KG queries using LangGraph. Tries up to max_attempts, generating a new Cypher query each time.
+    Generic retry logic for KG queries. Tries up to max_attempts, generating a new Cypher query each time.
 
     Args:
         user_query (str): The user's natural language query.
         chain: The GraphCypherQAChain to use (e.g., self.prime_kg_chain or self.ckg_chain).
+        cheap_chain: Optional chain on a cheaper model. It gets the first attempt; if that raises or
+            returns nothing, the same attempt is escalated to `chain`, which handles all retries.
         cypher_generator (Callable): Function to generate a Cypher query for each attempt.
         max_attempts (int): Maximum number of attempts.
         readable_filename (str): The name of the KG being queried.
 
     Returns:
-        dict: The final state after running the LangGraph, including queries tried and results.
+        dict: {"kg_result": rows or None, "text": ""}.
 
     Note:
         This method is synchronous. If you want to use it in an async context, call it with asyncio.to_thread or refactor for async support.
+        With KG_PARALLEL_ATTEMPTS=1 all attempts run concurrently and the first non-empty result wins,
+        trading up to max_attempts LLM calls per query for the latency of one.
     """
-    def query_node(state: KGQueryState):
-        cypher_query_prompt = cypher_generator(state["user_query"], state["attempt"])
-        if current_app and current_app.debug:
-            print(f"[DEBUG][KG] Attempt {state['attempt']} - Generated Cypher Query Prompt: {cypher_query_prompt}")
+    def invoke(cypher_query_prompt, attempt):
+        if attempt == 0 and cheap_chain is not None:
+            try:
+                result = cheap_chain.invoke({"query": cypher_query_prompt})
+                if isinstance(result, dict) and result.get("result"):
+                    return result
+            except Exception as e:
+                logger.debug("Cheap Cypher chain failed: %s", e)
+            logger.info("Escalating %s query to %s", readable_filename, KG_CYPHER_MODEL_STRONG)
+        return chain.invoke({"query": cypher_query_prompt})
+
+    def run_attempt(attempt):
+        cypher_query_prompt = cypher_generator(user_query, attempt)
+        logger.debug("Attempt %d - Generated Cypher Query Prompt: %s", attempt, cypher_query_prompt)
         try:
-            result = chain.invoke({"query": cypher_query_prompt})
-            if current_app and current_app.debug:
-                print(f"[DEBUG][KG] Chain result (type: {type(result)}): {result}")
+            result = invoke(cypher_query_prompt, attempt)
+            logger.debug("Chain result (type: %s): %s", type(result).__name__, result)
             cypher_query_actual = cypher_query_prompt  # fallback
             if isinstance(result, dict):
                 steps = result.get("intermediate_steps")
@@ -535,56 +973,43 @@ class GraphDatabase:
                             if cypher_query_actual.lower().startswith("cypher"):
                                 cypher_query_actual = cypher_query_actual.split("\n", 1)[-1].strip()
                             break
-        except Exception as e:
-            if current_app and current_app.debug:
-                print(f"[ERROR][KG] Exception in chain.invoke: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Exception in %s chain.invoke", readable_filename)
             result = {}
             cypher_query_actual = cypher_query_prompt
+        return result, cypher_query_actual
 
-        return {
-            "queries_tried": state["queries_tried"] + [cypher_query_actual],
-            "results": result,
-            "attempt": state["attempt"] + 1,
-        }
-
-    def should_retry(state: KGQueryState):
-        results = state["results"]
-        if current_app and current_app.debug:
-            print(f"[DEBUG][KG] should_retry called. Attempt: {state['attempt']}, Results: {results}")
-        # Only return success if the 'result' field in the results dict is non-empty
+    def run_attempts_in_parallel():
+        # A pool of its own, sized to the fan-out: _query_executor is reserved for run_many's Neo4j queries.
+        executor = ThreadPoolExecutor(max_workers=max_attempts, thread_name_prefix='kg-attempt')
+        try:
+            futures = [executor.submit(run_attempt, attempt) for attempt in range(max_attempts)]
+            queries_tried, results = [], {}
+            for future in as_completed(futures):
+                attempt_result, cypher_query_actual = future.result()
+                queries_tried.append(cypher_query_actual)
+                if isinstance(attempt_result, dict) and attempt_result.get("result"):
+                    results = attempt_result
+                    break
+        finally:
+            # Don't wait for the losing attempts.
+            executor.shutdown(wait=False, cancel_futures=True)
+        return {"queries_tried": queries_tried, "results": results}
+
+    if os.getenv('KG_PARALLEL_ATTEMPTS') == '1' and max_attempts > 1:
+        return self._finish_kg_query(run_attempts_in_parallel())
+
+    queries_tried, results = [], {}
+    for attempt in range(max_attempts):
+        results, cypher_query_actual = run_attempt(attempt)
+        queries_tried.append(cypher_query_actual)
+        # Only stop early if the 'result' field in the results dict is non-empty
         if isinstance(results, dict) and results.get("result"):
-            if current_app and current_app.debug:
-                print("[DEBUG][KG] should_retry: Success condition met.")
-            return "success"
-        elif state["attempt"] < state["max_attempts"]:
-            if current_app and current_app.debug:
-                print("[DEBUG][KG] should_retry: Retrying...")
-            return "query_node"
-        else:
-            if current_app and current_app.debug:
-                print("[DEBUG][KG] should_retry: Max attempts reached. Failing.")
-            return "fail"
-
-    builder = StateGraph(KGQueryState)
-    builder.add_node("query_node", query_node)
-    builder.add_conditional_edges("query_node", should_retry, {
-        "success": END,
-        "fail": END,
-        "query_node": "query_node"
-    })
-    builder.add_edge(START, "query_node")
-    graph = builder.compile()
-
-    initial_state = KGQueryState(
-        user_query=user_query,
-        attempt=0,
-        queries_tried=[],
-        results={},
-        max_attempts=max_attempts,
-    )
-    result = graph.invoke(initial_state)
+            break
+    return self._finish_kg_query({"queries_tried": queries_tried, "results": results})
+
+  def _finish_kg_query(self, result: dict) -> dict:
+    """Turn the final retry state into the {kg_result, text} answer."""
     # If after all attempts there are no results, return minimal structure
     results = result.get("results")
     if not results or (isinstance(results, dict) and not results.get("result")):
@@ -602,14 +1027,14 @@ class GraphDatabase:
 
   def run_primekg_query_with_retries(self, user_query: str, max_attempts: int = 3):
     """
-    Retry-enabled PrimeKG query using LangGraph. Tries up to max_attempts with different Cypher strategies.
+    Retry-enabled PrimeKG query. Tries up to max_attempts with different Cypher strategies.
 
     Args:
         user_query (str): The user's natural language query.
         max_attempts (int): Maximum number of attempts.
 
     Returns:
-        dict: The final state after running the LangGraph, including queries tried and results.
+        dict: {"kg_result": rows or None, "text": ""}.
     """
     return self.run_kg_query_with_retries(
         user_query=user_query,
@@ -617,18 +1042,19 @@ class GraphDatabase:
         cypher_generator=generate_primekg_cypher,
         max_attempts=max_attempts,
         readable_filename="PrimeKG",
+        cheap_chain=self._cheap_chain('prime_kg_chain_cheap'),
     )
 
   def run_clinicalkg_query_with_retries(self, user_query: str, max_attempts: int = 3):
     """
-    Retry-enabled Clinical KG query using LangGraph. Tries up to max_attempts with different Cypher strategies.
+    Retry-enabled Clinical KG query. Tries up to max_attempts with different Cypher strategies.
 
     Args:
         user_query (str): The user's natural language query.
         max_attempts (int): Maximum number of attempts.
 
     Returns:
-        dict: The final state after running the LangGraph, including queries tried and results.
+        dict: {"kg_result": rows or None, "text": ""}.
     """
     return self.run_kg_query_with_retries(
         user_query=user_query,
@@ -636,14 +1062,19 @@ class GraphDatabase:
         cypher_generator=generate_clinicalkg_cypher,
         max_attempts=max_attempts,
         readable_filename="ClinicalKG",
+        cheap_chain=self._cheap_chain('ckg_chain_cheap'),
     )
 
+  @functools.cached_property
+  def _openai_client(self):
+    from openai import OpenAI
+    return OpenAI(api_key=self.vlads_openai_key, http_client=_openai_http_client())
+
   def generate_openai_summary(self, user_query: str, kg_result: list) -> str:
     """
     Generate a summary using the OpenAI API, given the user query and the first 5 results from the KG.
     """
-    from openai import OpenAI
-    client = OpenAI(api_key=self.vlads_openai_key)
+    client = self._openai_client
     # Truncate or format kg_result for prompt if it's very large
     context_str = str(kg_result[:5])[:4000]  # use first 5 results, adjust as needed for token limits
 
@@ -654,37 +1085,70 @@ class GraphDatabase:
     )
 
     response = client.chat.completions.create(
-        model="gpt-4o",  # or "gpt-3.5-turbo" if you want to save cost
+        model=KG_SUMMARY_MODEL,
         messages=[{"role": "user", "content": prompt}],
         max_tokens=256,
         temperature=0.3,
     )
     return response.choices[0].message.content.strip()
 
-  def getPrimeKGContexts(self, user_query: str) -> dict:
+  @functools.cached_property
+  def _semantic_cache(self):
+    """
+    Answer cache for paraphrased KG questions; opt-in via KG_SEMANTIC_CACHE_SIZE (e.g. 512).
+    Off by default: questions differing only in a qualifier (type 1 vs type 2 diabetes,
+    adult vs paediatric) can clear the similarity threshold and get each other's answer.
+    """
+    max_entries = int(os.getenv('KG_SEMANTIC_CACHE_SIZE', '0'))
+    if max_entries <= 0:
+      return None
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-small", api_key=self.vlads_openai_key)
+    return SemanticCache(embeddings.embed_query,
+                         threshold=float(os.getenv('KG_SEMANTIC_CACHE_THRESHOLD', '0.95')),
+                         max_entries=max_entries)
+
+  def _clear_semantic_cache(self):
+    """Drop semantically cached answers, which may have been produced against an older schema."""
+    cache = self.__dict__.get('_semantic_cache')
+    if cache is not None:
+      cache.clear()
+
+  def _get_kg_contexts(self, kg_name: str, user_query: str, run_query) -> dict:
+    """
+    Run a KG query plus summary. Repeats of an earlier question are served from the
+    exact-match cache (before anything is embedded), near-identical ones from the
+    semantic cache. Only successful, summarized answers are cached.
+    """
+    cache_key = _kg_result_cache_key(kg_name, user_query)
+    cached = self._get_cached_kg_result(cache_key)
+    if cached is not None:
+      return cached
+    cache, vector = self._semantic_cache, None
+    if cache is not None:
+      try:
+        cached, vector = cache.lookup(kg_name, user_query)
+        if cached is not None:
+          return cached
+      except Exception as e:
+        logger.warning("KG semantic cache lookup failed: %s", e)
     try:
-        response = self.run_primekg_query_with_retries(user_query)
+        response = run_query(user_query)
         kg_result = self._extract_kg_result(response)
         if kg_result:
             summary = self.generate_openai_summary(user_query, kg_result)
-            return {"kg_result": kg_result, "text": summary}
+            contexts = {"kg_result": kg_result, "text": summary}
+            self._cache_kg_result(cache_key, contexts)
+            if vector is not None:
+              cache.insert(kg_name, user_query, contexts, vector)
+            return contexts
         else:
             return {"kg_result": None, "text": ""}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("%s context lookup failed", kg_name)
         return {"kg_result": None, "text": ""}
 
+  def getPrimeKGContexts(self, user_query: str) -> dict:
+    return self._get_kg_contexts("PrimeKG", user_query, self.run_primekg_query_with_retries)
+
   def getClinicalKGContexts(self, user_query: str) -> dict:
-    try:
-        response = self.run_clinicalkg_query_with_retries(user_query)
-        kg_result = self._extract_kg_result(response)
-        if kg_result:
-            summary = self.generate_openai_summary(user_query, kg_result)
-            return {"kg_result": kg_result, "text": summary}
-        else:
-            return {"kg_result": None, "text": ""}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {"kg_result": None, "text": ""}
+    return self._get_kg_contexts("ClinicalKG", user_query, self.run_clinicalkg_query_with_retries)
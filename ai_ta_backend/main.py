@@ -1,6 +1,7 @@
 import asyncio
 import json
 import os
+import threading
 import time
 from typing import List
 
@@ -43,6 +44,7 @@ from ai_ta_backend.service.retrieval_service import RetrievalService
 from ai_ta_backend.service.sentry_service import SentryService
 from ai_ta_backend.service.workflow_service import WorkflowService
 from ai_ta_backend.utils.email.send_transactional_email import send_email
+from ai_ta_backend.utils.embedding_cache import EmbeddingCache
 from ai_ta_backend.utils.pubmed_extraction import extractPubmedData
 from ai_ta_backend.utils.rerun_webcrawl_for_project import webscrape_documents
 
@@ -780,6 +782,12 @@ def configure(binder: Binder) -> None:
   binder.bind(ThreadPoolExecutorInterface, to=ThreadPoolExecutorAdapter(max_workers=10), scope=SingletonScope)
   binder.bind(ProcessPoolExecutorInterface, to=ProcessPoolExecutorAdapter(max_workers=10), scope=SingletonScope)
   binder.bind(RetrievalService, to=RetrievalService, scope=RequestScope)
+  # EMBEDDING_CACHE_SIZE=0 disables the in-process tier; Redis is used when REDIS_URL is set.
+  binder.bind(EmbeddingCache,
+              to=EmbeddingCache(redis_url=os.getenv('REDIS_URL'),
+                                local_max=int(os.getenv('EMBEDDING_CACHE_SIZE', '4096')),
+                                ttl=int(os.getenv('EMBEDDING_CACHE_TTL', str(24 * 60 * 60)))),
+              scope=SingletonScope)
   binder.bind(PosthogService, to=PosthogService, scope=SingletonScope)
   # binder.bind(SentryService, to=SentryService, scope=SingletonScope)
   binder.bind(NomicService, to=NomicService, scope=SingletonScope)
@@ -792,7 +800,13 @@ def configure(binder: Binder) -> None:
   binder.bind(GraphDatabase, to=GraphDatabase, scope=SingletonScope)
 
 
-FlaskInjector(app=app, modules=[configure])
+flask_injector = FlaskInjector(app=app, modules=[configure])
+
+# GraphDatabase is a lazy singleton that only the KG routes inject, so without this the
+# first KG request would build the graphs and chains itself.
+if os.getenv('KG_WARM_UP_ON_INIT') == '1':
+  threading.Thread(target=lambda: flask_injector.injector.get(GraphDatabase).warm_up(), name='kg-warm-up',
+                   daemon=True).start()
 
 if __name__ == '__main__':
   app.run(debug=True, port=int(os.getenv("PORT", default=8000)))  # nosec -- reasonable bandit error suppression
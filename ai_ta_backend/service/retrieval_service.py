@@ -29,6 +29,7 @@ from ai_ta_backend.executors.thread_pool_executor import ThreadPoolExecutorAdapt
 # from ai_ta_backend.service.nomic_service import NomicService
 from ai_ta_backend.service.posthog_service import PosthogService
 from ai_ta_backend.service.sentry_service import SentryService
+from ai_ta_backend.utils.embedding_cache import EmbeddingCache
 
 
 class RetrievalService:
@@ -38,13 +39,15 @@ class RetrievalService:
 
   @inject
   def __init__(self, vdb: VectorDatabase, sqlDb: SQLDatabase, aws: AWSStorage, posthog: PosthogService,
-               sentry: SentryService, thread_pool_executor: ThreadPoolExecutorAdapter):
+               sentry: SentryService, thread_pool_executor: ThreadPoolExecutorAdapter, embedding_cache: EmbeddingCache):
     self.vdb = vdb
     self.sqlDb = sqlDb
     self.aws = aws
     self.sentry = sentry
     self.posthog = posthog
     self.thread_pool_executor = thread_pool_executor
+    # Process-wide (bound as a singleton in main.configure), so repeated search queries skip the embedding round trip.
+    self.embedding_cache = embedding_cache
     openai.api_key = os.environ["VLADS_OPENAI_KEY"]
 
     self.embeddings = OpenAIEmbeddings(
@@ -57,6 +60,7 @@ class RetrievalService:
     )
 
     self.nomic_embeddings = OllamaEmbeddings(base_url=os.environ['OLLAMA_SERVER_URL'], model='nomic-embed-text:v1.5')
+    self.embedding_cache_hit = False
 
     # self.llm = AzureChatOpenAI(
     #     temperature=0,
@@ -542,7 +546,12 @@ class RetrievalService:
 
   def _embed_query_and_measure_latency(self, search_query, embedding_client):
     openai_start_time = time.monotonic()
-    user_query_embedding = embedding_client.embed_query(search_query)
+    model_name = getattr(embedding_client, 'model', type(embedding_client).__name__)
+    user_query_embedding = self.embedding_cache.get(model_name, search_query)
+    self.embedding_cache_hit = user_query_embedding is not None
+    if not self.embedding_cache_hit:
+      user_query_embedding = embedding_client.embed_query(search_query)
+      self.embedding_cache.put(model_name, search_query, user_query_embedding)
     self.openai_embedding_latency = time.monotonic() - openai_start_time
     return user_query_embedding
 
@@ -584,6 +593,7 @@ class RetrievalService:
             "course_name": course_name,
             "qdrant_latency_sec": self.qdrant_latency_sec,
             "openai_embedding_latency_sec": self.openai_embedding_latency,
+            "embedding_cache_hit": self.embedding_cache_hit,
             # "max_vector_score": max_vector_score,
             # "min_vector_score": min_vector_score,
             # "avg_vector_score": avg_vector_score,
@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+import redis
+
+
+class EmbeddingCache:
+  """
+  Two-tier cache of query embeddings: an in-process LRU in front of an optional shared Redis tier.
+
+  Entries are keyed by (embedding model, sha256 of the exact text), so vectors from different
+  models never mix. Both tiers hold vectors as packed float32 (about 6 KB for a 1536-dim
+  embedding, versus about 48 KB as a list of floats); Redis entries carry a TTL. If Redis is
+  unset or unreachable the cache silently degrades to the local tier only.
+  """
+
+  def __init__(self, redis_url: Optional[str] = None, local_max: int = 4096, ttl: int = 24 * 60 * 60):
+    self.local_max = local_max
+    self.ttl = ttl
+    self._local: OrderedDict = OrderedDict()  # redis key -> array('f') vector
+    self._lock = threading.Lock()
+    self._redis = redis.Redis.from_url(redis_url, socket_timeout=1) if redis_url else None
+
+  @staticmethod
+  def _key(model: str, text: str) -> str:
+    return f"embedding:{model}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+  def get(self, model: str, text: str) -> Optional[List[float]]:
+    key = self._key(model, text)
+    with self._lock:
+      if key in self._local:
+        self._local.move_to_end(key)
+        return self._local[key].tolist()
+    if self._redis is None:
+      return None
+    try:
+      raw = self._redis.get(key)
+    except redis.RedisError as e:
+      print(f"Embedding cache read failed, falling back to local tier: {e}")
+      return None
+    if not raw:
+      return None
+    vector = array('f', raw)
+    self._put_local(key, vector)
+    return vector.tolist()
+
+  def put(self, model: str, text: str, vector: List[float]):
+    key = self._key(model, text)
+    packed = array('f', vector)
+    self._put_local(key, packed)
+    if self._redis is None:
+      return
+    try:
+      self._redis.setex(key, self.ttl, packed.tobytes())
+    except redis.RedisError as e:
+      print(f"Embedding cache write failed: {e}")
+
+  def _put_local(self, key: str, vector: array):
+    if self.local_max <= 0:
+      return
+    with self._lock:
+      self._local[key] = vector
+      self._local.move_to_end(key)
+      while len(self._local) > self.local_max:
+        self._local.popitem(last=False)
@@ -0,0 +1,65 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+  """Lowercase and collapse whitespace so trivially different queries share a cache entry."""
+  return re.sub(r'\s+', ' ', query.strip().lower())
+
+
+class SemanticCache:
+  """
+  In-process semantic cache for expensive question -> answer pipelines.
+
+  A lookup embeds the (normalized) query and returns the stored value of the most similar
+  previous query in the same namespace when their cosine similarity is >= threshold.
+  Entries are evicted least-recently-used once max_entries is reached.
+  """
+
+  def __init__(self, embed_fn: Callable[[str], List[float]], threshold: float = 0.95, max_entries: int = 512):
+    self._embed_fn = embed_fn
+    self.threshold = threshold
+    self.max_entries = max_entries
+    self._entries: OrderedDict = OrderedDict()  # (namespace, normalized query) -> (unit vector, value)
+    self._lock = threading.Lock()
+
+  def embed(self, query: str) -> np.ndarray:
+    vector = np.asarray(self._embed_fn(normalize_query(query)), dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+  def lookup(self, namespace: str, query: str) -> Tuple[Optional[Any], np.ndarray]:
+    """
+    Returns (cached value or None, query embedding). Pass the embedding back to insert()
+    on a miss so the query is only embedded once.
+    """
+    vector = self.embed(query)
+    with self._lock:
+      best_key, best_score = None, self.threshold
+      for key, (cached_vector, _) in self._entries.items():
+        if key[0] != namespace:
+          continue
+        score = float(np.dot(vector, cached_vector))
+        if score >= best_score:
+          best_key, best_score = key, score
+      if best_key is None:
+        return None, vector
+      self._entries.move_to_end(best_key)
+      return self._entries[best_key][1], vector
+
+  def insert(self, namespace: str, query: str, value: Any, vector: Optional[np.ndarray] = None):
+    if vector is None:
+      vector = self.embed(query)
+    with self._lock:
+      key = (namespace, normalize_query(query))
+      self._entries[key] = (vector, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()